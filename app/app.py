@@ -6,6 +6,11 @@ from app.config import config
 
 
 def create_app(config_name="default"):
+    """Build the application.
+
+    This runs once per gunicorn worker (or once in total with --preload), so it does no
+    database work; tables are created by the init-db command.
+    """
     app = Flask(__name__, static_folder="static", template_folder="templates")
 
     app.config.from_object(config[config_name])
@@ -18,15 +23,23 @@ def create_app(config_name="default"):
         level=logging.INFO,
     )
 
-    with app.app_context():
-        from .models import db
+    from .models import db
+
+    db.init_app(app)
+
+    from .views import exports, profiles, views
+
+    app.register_blueprint(views)
+    app.register_blueprint(exports)
+    app.register_blueprint(profiles)
 
-        db.init_app(app)
+    from .profiling import init_app
 
-        db.create_all()
+    init_app(app)
 
-        from .views import views
+    from .commands import commands
 
-        app.register_blueprint(views)
+    for command in commands:
+        app.cli.add_command(command)
 
-        return app
+    return app
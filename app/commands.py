@@ -0,0 +1,45 @@
+import click
+from flask.cli import with_appcontext
+
+from app import stats
+from app.export import export_updates
+from app.models import Update, db
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db():
+    """Create any missing tables. Run once per deploy, before starting the app."""
+    db.create_all()
+    click.echo("Initialized database")
+
+
+@click.command("index-updates")
+@with_appcontext
+def index_updates():
+    """Backfill the allegation and officer association tables for existing updates."""
+    count = 0
+    for update in Update.query.order_by(Update.id).all():
+        update.index()
+        count += 1
+    db.session.commit()
+    click.echo(f"Indexed {count} updates")
+
+
+@click.command("rebuild-stats")
+@with_appcontext
+def rebuild_stats():
+    """Recompute the statistics rollups from scratch."""
+    stats.rebuild()
+    click.echo("Rebuilt statistics")
+
+
+@click.command("export")
+@with_appcontext
+def export():
+    """Append updates added since the last export to the bulk export files."""
+    count = export_updates()
+    click.echo(f"Exported {count} updates")
+
+
+commands = [init_db, index_updates, rebuild_stats, export]
@@ -13,12 +13,44 @@ class BaseConfig:
 
     DOMAIN = os.environ.get("DOMAIN", "https://spd-data-watch.tech-bloc-sea.dev")
     LOGGING_DIR = Path(os.environ.get("LOGGING_DIR", ".data"))
+    EXPORT_DIR = Path(
+        os.environ.get("EXPORT_DIR", _basedir.parent / ".data" / "export")
+    )
+
+    # Append new updates to the bulk export files after each refresh that finds some
+    EXPORT_ON_REFRESH = True
 
     REFRESH_INTERVAL = timedelta(hours=1)
     RETRY_INTERVAL = timedelta(minutes=10)
+    # How far back the daily sweep re-checks cases for changes (None disables sweeps)
+    SWEEP_WINDOW = timedelta(days=90)
+    # Upper bound on rows an updater fetches at once (paged 1000 at a time). A fetch that
+    # would exceed it fails instead of silently working on partial cases; for a sweep
+    # the updater then falls back to fetching new entries only.
+    FETCH_MAX_ROWS = 20000
 
     ITEMS_PER_PAGE = 25
 
+    # /updates/stream: seconds between checks for new updates (None disables live
+    # events), events buffered per client before it is disconnected, seconds between
+    # keepalives, and updates replayed per connection from Last-Event-ID
+    STREAM_POLL_INTERVAL = 5
+    # Each stream client holds a gunicorn thread for as long as it is connected. Keep
+    # this below --threads so the rest of the site always has threads to serve with;
+    # clients beyond it get a 503.
+    STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", 16))
+    STREAM_BUFFER = 100
+    STREAM_KEEPALIVE = 15
+    STREAM_REPLAY_LIMIT = 500
+
+    # Profiling: requests with an X-Profile header matching the token are profiled, as
+    # are the given fraction of all requests and refreshes. Reports are written to
+    # LOGGING_DIR/profiles and listed at /profiles (which also requires the header).
+    PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")
+    PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_REFRESH_RATE = float(os.environ.get("PROFILE_REFRESH_RATE", 0))
+    PROFILE_KEEP = 200
+
     ROSTER_CSV_URL = os.environ.get("ROSTER_CSV_URL")
     UID_CSV_URL = os.environ.get("UID_CSV_URL")
 
@@ -26,6 +58,9 @@ class BaseConfig:
 class TestConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
 
+    EXPORT_ON_REFRESH = False
+    STREAM_POLL_INTERVAL = None
+
     REFRESH_INTERVAL = timedelta(hours=1)
     RETRY_INTERVAL = timedelta(minutes=10)
 
@@ -0,0 +1,171 @@
+import csv
+import fcntl
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.models import Update
+
+
+FORMATS = ["ndjson", "csv"]
+MANIFEST = "manifest.json"
+
+CSV_FIELDS = [
+    "id",
+    "create_date",
+    "event_date",
+    "type",
+    "officers",
+    "allegations",
+    "url",
+    "case_num",
+    "disposition",
+]
+
+
+def _row(update: Update) -> Dict:
+    row = update.to_dict()
+    row["create_date"] = update.create_date.isoformat()
+    row["event_date"] = update.event_date.isoformat()
+    return row
+
+
+def _ndjson(rows: List[Dict], header: bool) -> bytes:
+    return "".join(json.dumps(row) + "\n" for row in rows).encode()
+
+
+def _csv(rows: List[Dict], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow(
+            {
+                **row,
+                "officers": json.dumps(row["officers"]),
+                "allegations": json.dumps(row["allegations"]),
+            }
+        )
+    return buffer.getvalue().encode()
+
+
+_writers = {"ndjson": _ndjson, "csv": _csv}
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(export_dir: Path) -> Dict:
+    try:
+        with open(export_dir / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "files": {}}
+
+
+def _write_manifest(export_dir: Path, manifest: Dict):
+    tmp = export_dir / f".{MANIFEST}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, export_dir / MANIFEST)
+
+
+def _file_entry(path: Path, partition: str, fmt: str, rows: int) -> Dict:
+    return {
+        "partition": partition,
+        "format": fmt,
+        "rows": rows,
+        "bytes": path.stat().st_size,
+        "sha256": _sha256(path),
+    }
+
+
+def _rebuild_file(path: Path, entry: Dict, last_id: int) -> Dict:
+    """Rewrite an export file from the database with updates up to last_id."""
+    rows = [
+        _row(update)
+        for update in Update.query.filter(
+            Update.id <= last_id,
+            func.strftime("%Y-%m", Update.create_date) == entry["partition"],
+        ).order_by(Update.id)
+    ]
+    with open(path, "wb") as f:
+        f.write(_writers[entry["format"]](rows, header=True))
+    return _file_entry(path, entry["partition"], entry["format"], len(rows))
+
+
+def export_updates() -> int:
+    """Append updates added since the last export to the export files.
+
+    Files are partitioned by the month of the refresh that created the update, so only
+    the newest partitions change. The manifest records the last exported update id and
+    the size, row count and checksum of every file; a file is truncated back to its
+    recorded size before appending so an interrupted export can be rerun safely. Files
+    that are missing or shorter than recorded are rebuilt from the database.
+
+    Returns the number of updates exported.
+    """
+    export_dir = Path(current_app.config["EXPORT_DIR"])
+    export_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(export_dir / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        manifest = read_manifest(export_dir)
+
+        rebuilt = False
+        for name, entry in manifest["files"].items():
+            path = export_dir / name
+            if not path.exists() or path.stat().st_size < entry["bytes"]:
+                current_app.logger.warning("Rebuilding damaged export file %s", name)
+                manifest["files"][name] = _rebuild_file(
+                    path, entry, manifest["last_id"]
+                )
+                rebuilt = True
+
+        updates = (
+            Update.query.filter(Update.id > manifest["last_id"])
+            .order_by(Update.id)
+            .all()
+        )
+        if not updates:
+            if rebuilt:
+                _write_manifest(export_dir, manifest)
+            return 0
+
+        partitions = {}
+        for update in updates:
+            partition = update.create_date.strftime("%Y-%m")
+            partitions.setdefault(partition, []).append(_row(update))
+
+        for partition, rows in partitions.items():
+            for fmt in FORMATS:
+                name = f"updates-{partition}.{fmt}"
+                path = export_dir / name
+                entry = manifest["files"].get(name, {"bytes": 0, "rows": 0})
+
+                with open(path, "ab") as f:
+                    f.truncate(entry["bytes"])
+                    f.write(_writers[fmt](rows, header=entry["bytes"] == 0))
+
+                manifest["files"][name] = _file_entry(
+                    path, partition, fmt, entry["rows"] + len(rows)
+                )
+
+        manifest["last_id"] = updates[-1].id
+        _write_manifest(export_dir, manifest)
+
+    current_app.logger.info("Exported %s updates", len(updates))
+    return len(updates)
@@ -1,4 +1,6 @@
 import enum
+import hashlib
+import json
 
 from flask_sqlalchemy import SQLAlchemy
 
@@ -10,6 +12,63 @@ class UpdateType(enum.Enum):
     CCS_PUBLISHED = "Closed Case Summary Published"
     COMPLAINT_FILED = "Complaint Filed"
     INVESTIGATION_CLOSED = "Investigation Closed"
+    # An already reported complaint whose allegations, disposition or officers changed
+    CASE_UPDATED = "Case Update"
+
+
+update_allegations = db.Table(
+    "update_allegations",
+    db.Column("update_id", db.Integer, db.ForeignKey("updates.id"), primary_key=True),
+    db.Column(
+        "allegation_id",
+        db.Integer,
+        db.ForeignKey("allegations.id"),
+        primary_key=True,
+        index=True,
+    ),
+)
+
+update_officers = db.Table(
+    "update_officers",
+    db.Column("update_id", db.Integer, db.ForeignKey("updates.id"), primary_key=True),
+    db.Column(
+        "officer_id",
+        db.Integer,
+        db.ForeignKey("officers.id"),
+        primary_key=True,
+        index=True,
+    ),
+)
+
+
+class Allegation(db.Model):
+    __tablename__ = "allegations"
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    name = db.Column(db.String, nullable=False, unique=True, index=True)
+
+    @staticmethod
+    def get_or_create(name):
+        allegation = Allegation.query.filter_by(name=name).one_or_none()
+        if not allegation:
+            allegation = Allegation(name=name)
+            db.session.add(allegation)
+        return allegation
+
+
+class Officer(db.Model):
+    __tablename__ = "officers"
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    name = db.Column(db.String, nullable=False, unique=True, index=True)
+
+    @staticmethod
+    def get_or_create(name):
+        officer = Officer.query.filter_by(name=name).one_or_none()
+        if not officer:
+            officer = Officer(name=name)
+            db.session.add(officer)
+        return officer
 
 
 class Update(db.Model):
@@ -32,6 +91,43 @@ class Update(db.Model):
     case_num = db.Column(db.String, nullable=False)
     disposition = db.Column(db.String, nullable=True)
 
+    # Indexed copies of the officers and allegations JSON columns, used for filtering
+    allegation_index = db.relationship(
+        Allegation, secondary=update_allegations, lazy="select"
+    )
+    officer_index = db.relationship(Officer, secondary=update_officers, lazy="select")
+
+    def index(self):
+        """Populate the allegation and officer association tables from the JSON columns."""
+        self.allegation_index = [
+            Allegation.get_or_create(name) for name in set(self.allegations or [])
+        ]
+        self.officer_index = [
+            Officer.get_or_create(name) for name in set(self.officers or [])
+        ]
+
+    @staticmethod
+    def filtered(allegation=None, officer=None):
+        """Return an Update query restricted to updates with the given allegation and/or officer."""
+        query = Update.query
+        if allegation:
+            query = query.join(Update.allegation_index).filter(
+                Allegation.name == allegation
+            )
+        if officer:
+            query = query.join(Update.officer_index).filter(Officer.name == officer)
+        return query
+
+    def state_hash(self, include_allegations=True):
+        """Compact hash of the fields that identify a change to the case."""
+        state = [
+            sorted(self.allegations or []) if include_allegations else None,
+            self.disposition,
+            sorted(self.officers or []),
+            self.url,
+        ]
+        return hashlib.blake2b(json.dumps(state).encode(), digest_size=8).hexdigest()
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -46,6 +142,29 @@ class Update(db.Model):
         }
 
 
+class CaseState(db.Model):
+    """Hash of the last seen allegations/disposition/officers of a case, per update type."""
+
+    __tablename__ = "case_states"
+
+    case_num = db.Column(db.String, nullable=False, primary_key=True)
+    type = db.Column(db.Enum(UpdateType), nullable=False, primary_key=True)
+    hash = db.Column(db.String(16), nullable=False)
+    updated_date = db.Column(db.DateTime, nullable=False)
+
+
+class UpdateStat(db.Model):
+    """Running count of updates per value of a dimension (type, disposition, etc.)"""
+
+    __tablename__ = "update_stats"
+    __table_args__ = (db.UniqueConstraint("dimension", "value"),)
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    dimension = db.Column(db.String, nullable=False)
+    value = db.Column(db.String, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
 class RefreshStatus(enum.Enum):
     STARTED = "Started"
     COMPLETED = "Completed"
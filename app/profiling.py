@@ -0,0 +1,173 @@
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from flask import Flask, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+PROFILE_HEADER = "X-Profile"
+
+_local = threading.local()
+_listening = False
+
+
+class Profile:
+    """cProfile output and SQL statement timings for one request or refresh."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profiler = cProfile.Profile()
+        self.queries: List[Tuple[float, str]] = []
+        self.started = None
+        self.duration = None
+
+    def start(self):
+        _local.profile = self
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        _local.profile = None
+
+    def report(self) -> str:
+        out = io.StringIO()
+        out.write(f"{self.name}\n")
+        out.write(f"Total: {self.duration * 1000:.1f} ms\n")
+        sql_time = sum(duration for duration, _ in self.queries)
+        out.write(f"SQL: {len(self.queries)} statements, {sql_time * 1000:.1f} ms\n\n")
+
+        for duration, statement in sorted(self.queries, reverse=True):
+            out.write(f"{duration * 1000:8.2f} ms  {' '.join(statement.split())}\n")
+
+        out.write("\n")
+        stats = pstats.Stats(self.profiler, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+        return out.getvalue()
+
+    def save(self, profile_dir: Path, keep: int):
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"\W+", "_", self.name).strip("_")[:60]
+        stem = f"{datetime.now():%Y%m%dT%H%M%S%f}-{self.duration * 1000:.0f}ms-{slug}"
+        (profile_dir / f"{stem}.txt").write_text(self.report())
+        # Binary stats for pstats/snakeviz
+        self.profiler.dump_stats(profile_dir / f"{stem}.prof")
+
+        for old in list_profiles(profile_dir)[keep:]:
+            (profile_dir / old).unlink(missing_ok=True)
+            (profile_dir / old).with_suffix(".prof").unlink(missing_ok=True)
+
+
+def _active() -> Optional[Profile]:
+    return getattr(_local, "profile", None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active():
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active()
+    if profile and conn.info.get("profile_query_start"):
+        started = conn.info["profile_query_start"].pop()
+        profile.queries.append((time.perf_counter() - started, statement))
+
+
+def profile_dir(app: Flask) -> Path:
+    return Path(app.config["LOGGING_DIR"]) / "profiles"
+
+
+def list_profiles(directory: Path) -> List[str]:
+    """Return profile report names, newest first."""
+    if not directory.exists():
+        return []
+    return sorted((p.name for p in directory.glob("*.txt")), reverse=True)
+
+
+def _token_matches(given: Optional[str]) -> bool:
+    token = current_app.config["PROFILING_TOKEN"]
+    return bool(token and given and hmac.compare_digest(token, given))
+
+
+def is_admin() -> bool:
+    """Whether the request carries the profiling token in the X-Profile header."""
+    return _token_matches(request.headers.get(PROFILE_HEADER))
+
+
+def _sampled(rate: float) -> bool:
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def _profile(name: str):
+    profile = Profile(name)
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+        app = current_app._get_current_object()
+        try:
+            profile.save(profile_dir(app), app.config["PROFILE_KEEP"])
+        except Exception:
+            app.logger.exception("Saving profile failed")
+
+
+def profile_refresh():
+    """Context manager that profiles a refresh if it is sampled. No-op otherwise."""
+    if _active() or not _sampled(current_app.config["PROFILE_REFRESH_RATE"]):
+        # Part of a profiled request already, or not sampled
+        return nullcontext()
+    return _profile("refresh")
+
+
+def _before_request():
+    if request.blueprint == "profiles":
+        return
+    if is_admin() or _sampled(current_app.config["PROFILE_SAMPLE_RATE"]):
+        g.profile = _profile(f"{request.method} {request.full_path}")
+        g.profile.__enter__()
+
+
+def _teardown_request(exc):
+    profile = g.pop("profile", None)
+    if profile:
+        profile.__exit__(None, None, None)
+
+
+def init_app(app: Flask):
+    """Install the request hooks and SQL timers if profiling is configured.
+
+    With no token and zero sample rates nothing is installed, so there is no overhead.
+    """
+    global _listening
+
+    if not (
+        app.config["PROFILING_TOKEN"]
+        or app.config["PROFILE_SAMPLE_RATE"]
+        or app.config["PROFILE_REFRESH_RATE"]
+    ):
+        return
+
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+    if app.config["PROFILING_TOKEN"] or app.config["PROFILE_SAMPLE_RATE"]:
+        # Registered on the app so blueprint hooks such as the refresh are included
+        app.before_request(_before_request)
+        app.teardown_request(_teardown_request)
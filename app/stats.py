@@ -0,0 +1,73 @@
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func
+
+from app.models import Allegation, Update, UpdateStat, db, update_allegations
+
+
+DIMENSIONS = ["type", "disposition", "allegation", "month"]
+
+
+def _update_keys(update: Update) -> Iterable[Tuple[str, str]]:
+    """Yield the (dimension, value) pairs an update is counted under."""
+    yield "type", update.type.name
+    yield "disposition", update.disposition or "Unknown"
+    for allegation in set(update.allegations or []):
+        yield "allegation", allegation
+    yield "month", update.event_date.strftime("%Y-%m")
+
+
+def _increment(counts: Counter):
+    for (dimension, value), count in counts.items():
+        stat = UpdateStat.query.filter_by(
+            dimension=dimension, value=value
+        ).one_or_none()
+        if not stat:
+            stat = UpdateStat(dimension=dimension, value=value, count=0)
+            db.session.add(stat)
+        stat.count += count
+
+
+def record_updates(updates: Iterable[Update]):
+    """Add new updates to the rollups. Changes are committed with the caller's transaction."""
+    _increment(Counter(key for update in updates for key in _update_keys(update)))
+
+
+def rebuild():
+    """Recompute all rollups from the updates table.
+
+    Allegation counts are read from the association table, so run index-updates first
+    if it has not been backfilled.
+    """
+    UpdateStat.query.delete()
+
+    counts = Counter()
+    for type_, count in db.session.query(Update.type, func.count()).group_by(
+        Update.type
+    ):
+        counts["type", type_.name] += count
+    for disposition, count in db.session.query(
+        Update.disposition, func.count()
+    ).group_by(Update.disposition):
+        counts["disposition", disposition or "Unknown"] += count
+    for name, count in (
+        db.session.query(Allegation.name, func.count())
+        .join(update_allegations)
+        .group_by(Allegation.name)
+    ):
+        counts["allegation", name] += count
+    month = func.strftime("%Y-%m", Update.event_date)
+    for value, count in db.session.query(month, func.count()).group_by(month):
+        counts["month", value] += count
+
+    _increment(counts)
+    db.session.commit()
+
+
+def summary() -> Dict[str, Dict[str, int]]:
+    """Return the rollups keyed by dimension, then value."""
+    stats = {dimension: {} for dimension in DIMENSIONS}
+    for stat in UpdateStat.query.order_by(UpdateStat.dimension, UpdateStat.value):
+        stats[stat.dimension][stat.value] = stat.count
+    return stats
@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+from flask import Flask, current_app
+
+from app.models import Update, db
+
+
+class Subscription:
+    """Events waiting to be sent to one client."""
+
+    def __init__(self, maxlen: int):
+        self.events = deque(maxlen=maxlen)
+        self.overflowed = False
+        self.ready = threading.Event()
+
+    def push(self, event: Tuple[int, str]):
+        if len(self.events) == self.events.maxlen:
+            # The client has fallen behind. Its stream ends once the buffer is sent, and
+            # it catches up from the database when it reconnects with Last-Event-ID.
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self.ready.set()
+
+
+class Broadcaster:
+    """Fans new updates out to the stream clients of this process.
+
+    Each gunicorn worker runs one poller thread that checks for new update ids, so the
+    database sees one cheap query per interval per worker regardless of the number of
+    connected clients, and updates committed by any worker reach every client. The
+    thread is started on the first subscription since threads don't survive the fork
+    of a preloaded app.
+
+    Every connected client holds a gunicorn thread, so connections are capped per
+    worker (STREAM_MAX_CLIENTS) below the thread count to leave threads for the rest
+    of the site.
+
+    The most recently published events are kept so a client that replayed from the
+    database before subscribing also gets anything published in between.
+    """
+
+    def __init__(self, recent: int = 100):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.recent = deque(maxlen=recent)
+        # Highest event id pushed out of self.recent
+        self.evicted_id = 0
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self, app: Flask):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            if not app.config["STREAM_POLL_INTERVAL"]:
+                return
+            # Read the starting point before any subscriber replays from the database,
+            # so no update falls between a replay and the first poll
+            last_id = max_update_id()
+            self.thread = threading.Thread(
+                target=self._poll,
+                args=(app, last_id),
+                name="update-stream",
+                daemon=True,
+            )
+            self.thread.start()
+
+    def stop(self):
+        """Stop the poller thread. It is started again by the next start()."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread:
+            self.stopped.set()
+            self.wake.set()
+            thread.join()
+            self.stopped.clear()
+        with self.lock:
+            # A restarted poller begins from the current max id, not from these
+            self.recent.clear()
+            self.evicted_id = 0
+
+    def notify(self):
+        """Poll immediately, e.g. after this process commits new updates."""
+        self.wake.set()
+
+    def subscribe(
+        self, maxlen: int, max_clients: int, after_id: Optional[int] = None
+    ) -> Optional[Subscription]:
+        """Register a client, or return None if max_clients are already connected.
+
+        If after_id is given, recently published events after it are queued first. If
+        some have already been forgotten the subscription is marked overflowed, so the
+        client reconnects and replays them from the database.
+        """
+        subscription = Subscription(maxlen)
+        with self.lock:
+            if len(self.subscriptions) >= max_clients:
+                return None
+            if after_id is not None:
+                if self.evicted_id > after_id:
+                    subscription.overflowed = True
+                for event in self.recent:
+                    if event[0] > after_id:
+                        subscription.push(event)
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, events: List[Tuple[int, str]]):
+        with self.lock:
+            for event in events:
+                if len(self.recent) == self.recent.maxlen:
+                    self.evicted_id = self.recent[0][0]
+                self.recent.append(event)
+                for subscription in self.subscriptions:
+                    subscription.push(event)
+
+    def _poll(self, app: Flask, last_id: int):
+        with app.app_context():
+            while not self.stopped.is_set():
+                self.wake.wait(app.config["STREAM_POLL_INTERVAL"])
+                self.wake.clear()
+                events = []
+                try:
+                    # Also published with nobody connected: it keeps last_id current
+                    # and fills the recent events that new subscribers catch up from
+                    events = fetch_events(last_id, app.config["STREAM_REPLAY_LIMIT"])
+                except Exception:
+                    app.logger.exception("Update stream poll failed")
+                finally:
+                    db.session.remove()
+                if events:
+                    last_id = events[-1][0]
+                    self.publish(events)
+
+
+broadcaster = Broadcaster()
+
+
+def max_update_id() -> int:
+    return db.session.query(db.func.max(Update.id)).scalar() or 0
+
+
+def fetch_events(after_id: int, limit: int) -> List[Tuple[int, str]]:
+    """Return (id, JSON) events for updates after the given id, oldest first."""
+    updates = Update.query.filter(Update.id > after_id).order_by(Update.id).limit(limit)
+    return [(update.id, current_app.json.dumps(update.to_dict())) for update in updates]
+
+
+def format_event(event: Tuple[int, str]) -> str:
+    id, data = event
+    return f"id: {id}\nevent: update\ndata: {data}\n\n"
+
+
+def stream(
+    subscription: Subscription,
+    replay: List[Tuple[int, str]],
+    keepalive: float,
+    last_id: Optional[int] = None,
+    replay_complete: bool = True,
+) -> Iterator[str]:
+    """Yield SSE messages: the replayed backlog, then live events until disconnect.
+
+    If the replay was cut short by the replay limit the stream ends after it, and the
+    client resumes from its Last-Event-ID when it reconnects. The caller unsubscribes
+    when the response is closed, which also covers streams that never start (HEAD).
+    """
+    yield "retry: 10000\n\n"
+    for event in replay:
+        yield format_event(event)
+        last_id = event[0]
+    if not replay_complete:
+        return
+
+    while True:
+        if not subscription.ready.wait(keepalive):
+            # Comment line, keeps proxies from timing out and detects closed clients
+            yield ": keepalive\n\n"
+            continue
+        subscription.ready.clear()
+        while subscription.events:
+            event = subscription.events.popleft()
+            if last_id is not None and event[0] <= last_id:
+                # Already sent as part of the replay
+                continue
+            yield format_event(event)
+            last_id = event[0]
+        if subscription.overflowed:
+            return
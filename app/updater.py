@@ -7,11 +7,27 @@ import requests
 from dateutil import parser
 from flask import current_app
 
+from app.export import export_updates
 from app.lookup import find_case
-from app.models import Refresh, RefreshStatus, Update, UpdateType, db
+from app.models import CaseState, Refresh, RefreshStatus, Update, UpdateType, db
+from app.profiling import profile_refresh
+from app.stats import record_updates
+from app.stream import broadcaster
 from app.utils import Regexps, validate
 
 
+# Keep IN (...) lists under SQLite's bound parameter limit
+STATE_QUERY_CHUNK = 500
+
+# Rows per request. Socrata silently stops at 1000 rows for a $query without a limit,
+# which would cut cases spread over several rows short, so results are paged.
+PAGE_SIZE = 1000
+
+
+class FetchLimitExceeded(RuntimeError):
+    pass
+
+
 class Updater(ABC):
     @abstractmethod
     def get_update_type(self) -> UpdateType:
@@ -24,9 +40,110 @@ class Updater(ABC):
     def process(self, data, update_dt) -> List[Update]:
         return NotImplemented
 
-    def update(self, last_update_dt, update_dt) -> List[Update]:
-        data = requests.get(self.get_update_url(last_update_dt)).json()
-        return self.process(data, update_dt)
+    def enrich(self, update: Update):
+        """Add details that are expensive to look up. Only called for changed cases."""
+        pass
+
+    # Whether a changed hash for an already reported case is emitted as a CASE_UPDATED
+    # update. Only one updater per dataset should, or one edit is reported twice; the
+    # others only use the stored state to skip cases they have already reported.
+    reports_changes = False
+
+    def state_hash(self, update: Update) -> str:
+        return update.state_hash()
+
+    def changed(self, updates, last_update_dt) -> List[Update]:
+        """Filter updates down to new cases, and changed ones if reports_changes is set.
+
+        A change is emitted with the CASE_UPDATED type rather than the updater's own,
+        so it isn't mistaken for a new complaint or closure. Stored hashes are only
+        changed by record_state, once the update is in the session, so a failed
+        refresh can't mark a case as seen without its update. Cases without a stored
+        state that are older than the high water mark were reported before state
+        tracking existed (or fell in a sweep window), so their state is recorded here
+        without emitting an update.
+        """
+        update_type = self.get_update_type()
+        hashes = {}
+        case_nums = list({update.case_num for update in updates})
+        for i in range(0, len(case_nums), STATE_QUERY_CHUNK):
+            for state in CaseState.query.filter(
+                CaseState.type == update_type,
+                CaseState.case_num.in_(case_nums[i : i + STATE_QUERY_CHUNK]),
+            ):
+                hashes[state.case_num] = state.hash
+
+        changed = []
+        for update in updates:
+            state_hash = self.state_hash(update)
+            if update.case_num not in hashes:
+                if update.event_date.date() > last_update_dt.date():
+                    changed.append(update)
+                else:
+                    db.session.add(
+                        CaseState(
+                            case_num=update.case_num,
+                            type=update_type,
+                            hash=state_hash,
+                            updated_date=update.create_date,
+                        )
+                    )
+            elif self.reports_changes and hashes[update.case_num] != state_hash:
+                update.type = UpdateType.CASE_UPDATED
+                changed.append(update)
+            hashes[update.case_num] = state_hash
+        return changed
+
+    def record_state(self, update: Update):
+        """Store the state hash of an update that has been added to the session."""
+        update_type = self.get_update_type()
+        state = CaseState.query.filter_by(
+            case_num=update.case_num, type=update_type
+        ).one_or_none()
+        if not state:
+            state = CaseState(case_num=update.case_num, type=update_type)
+            db.session.add(state)
+        state.hash = self.state_hash(update)
+        state.updated_date = update.create_date
+
+    def fetch(self, last_update_dt) -> List[dict]:
+        """Page through all rows since last_update_dt, up to FETCH_MAX_ROWS."""
+        max_rows = current_app.config["FETCH_MAX_ROWS"]
+        url = self.get_update_url(last_update_dt)
+        data = []
+        while True:
+            page = requests.get(f"{url} limit {PAGE_SIZE} offset {len(data)}").json()
+            data.extend(page)
+            if len(page) < PAGE_SIZE:
+                return data
+            if len(data) >= max_rows:
+                raise FetchLimitExceeded(
+                    f"{type(self).__name__} found more than {max_rows} rows since "
+                    f"{last_update_dt}"
+                )
+
+    def update(self, last_update_dt, update_dt, sweep_from=None) -> List[Update]:
+        """Fetch entries since last_update_dt, or since sweep_from to re-check older cases.
+
+        Only updaters that report changes sweep. The sweep is best effort: if it fails (e.g. the window holds more than
+        FETCH_MAX_ROWS) only the entries since last_update_dt are fetched, so new
+        entries still come in.
+        """
+        data = None
+        if self.reports_changes and sweep_from and sweep_from < last_update_dt:
+            try:
+                data = self.fetch(sweep_from)
+            except Exception:
+                current_app.logger.exception(
+                    "Sweep failed for %s, fetching new entries only", type(self)
+                )
+        if data is None:
+            data = self.fetch(last_update_dt)
+
+        updates = self.changed(self.process(data, update_dt), last_update_dt)
+        for update in updates:
+            self.enrich(update)
+        return updates
 
 
 class ClosedCaseSummaryUpdater(Updater):
@@ -34,7 +151,7 @@ class ClosedCaseSummaryUpdater(Updater):
         return UpdateType.CCS_PUBLISHED
 
     def get_update_url(self, last_update_dt) -> str:
-        return f"https://data.seattle.gov/api/id/m33m-84uk.json?$query=select * where (`posted_date` > '{last_update_dt.date().isoformat()}') order by `posted_date` desc"
+        return f"https://data.seattle.gov/api/id/m33m-84uk.json?$query=select * where (`posted_date` > '{last_update_dt.date().isoformat()}') order by `posted_date` desc, :id"
 
     def process_case(self, case, update_dt) -> Update:
         # Response:
@@ -63,27 +180,37 @@ class ClosedCaseSummaryUpdater(Updater):
         )
         update.type = self.get_update_type()
         update.url = validate(case["case"]["url"], Regexps.CCS_URL, None)
+        update.officers = []
 
+        return update
+
+    def state_hash(self, update: Update) -> str:
+        # Allegations come from a per-case lookup in enrich(), after the diff. Leave them
+        # out so the hash is the same before and after enrichment. Summaries don't
+        # report changes, so this only identifies summaries already published.
+        return update.state_hash(include_allegations=False)
+
+    def enrich(self, update: Update):
         result = find_case(update.case_num)
         if result:
             update.allegations = result.allegations
         else:
             update.allegations = []
 
-        update.officers = []
-
-        return update
-
     def process(self, data, update_dt) -> List[Update]:
         return [self.process_case(case, update_dt) for case in data]
 
 
 class NewComplaintUpdater(Updater):
+    # Reports later edits to a complaint's allegations, disposition or officers. The
+    # investigation closed updater reads the same dataset and leaves them to this one.
+    reports_changes = True
+
     def get_update_type(self) -> UpdateType:
         return UpdateType.COMPLAINT_FILED
 
     def get_update_url(self, last_update_dt) -> str:
-        return f"https://data.seattle.gov/api/id/hyay-5x7b.json?$query=select * where (`received_date` > '{last_update_dt.date().isoformat()}') order by `received_date` desc"
+        return f"https://data.seattle.gov/api/id/hyay-5x7b.json?$query=select * where (`received_date` > '{last_update_dt.date().isoformat()}') order by `received_date` desc, :id"
 
     def process_complaint(self, case_num, rows, update_dt) -> Update:
         # Response:
@@ -161,7 +288,7 @@ class ClosedInvestigationUpdater(Updater):
         return UpdateType.INVESTIGATION_CLOSED
 
     def get_update_url(self, last_update_dt) -> str:
-        return f"https://data.seattle.gov/api/id/hyay-5x7b.json?$query=select * where (`investigation_end_date` > '{last_update_dt.date().isoformat()}') order by `investigation_end_date` desc"
+        return f"https://data.seattle.gov/api/id/hyay-5x7b.json?$query=select * where (`investigation_end_date` > '{last_update_dt.date().isoformat()}') order by `investigation_end_date` desc, :id"
 
     def process_case(self, case_num, rows, update_dt) -> Update:
         # Response:
@@ -243,7 +370,18 @@ updaters = [
 
 
 def do_update(last_refresh, now):
-    """Retrieve updates from each updater and saves updates to the database."""
+    """Retrieve updates from each updater and saves updates to the database.
+
+    The first refresh of each day also re-fetches the last SWEEP_WINDOW of entries so
+    changes to older cases are picked up.
+    """
+    sweep_from = None
+    if (
+        current_app.config["SWEEP_WINDOW"]
+        and now.date() != last_refresh.refresh_date.date()
+    ):
+        sweep_from = now - current_app.config["SWEEP_WINDOW"]
+
     refresh = Refresh()
     refresh.status = RefreshStatus.STARTED
     refresh.refresh_date = now
@@ -255,8 +393,12 @@ def do_update(last_refresh, now):
         for updater, update_attr in updaters:
             # Get entries since latest entry we've seen
             last_updated = getattr(last_refresh, update_attr)
-            updates = updater.update(last_updated, now)
-            [db.session.add(update) for update in updates]
+            updates = updater.update(last_updated, now, sweep_from)
+            for update in updates:
+                db.session.add(update)
+                update.index()
+                updater.record_state(update)
+            record_updates(updates)
 
             # Set high water mark
             if len(updates):
@@ -277,12 +419,26 @@ def do_update(last_refresh, now):
         refresh.status = RefreshStatus.COMPLETED
         refresh.updates = update_count
     except Exception:
+        # Discard this refresh's updates and case states together; the retry fetches
+        # them again from the unchanged high water marks
+        db.session.rollback()
+        update_count = 0
         refresh.status = RefreshStatus.FAILED
         current_app.logger.exception("Update failed")
 
     db.session.add(refresh)
     db.session.commit()
 
+    if update_count:
+        broadcaster.notify()
+
+    if update_count and current_app.config["EXPORT_ON_REFRESH"]:
+        try:
+            export_updates()
+        except Exception:
+            # The export catches up on the next refresh or `flask export`
+            current_app.logger.exception("Export failed")
+
 
 def update(now=None):
     """Call do_update if an update is needed"""
@@ -303,7 +459,8 @@ def update(now=None):
                 # Assumption: there will always be a previous COMPLETED refresh
                 last_refresh = Refresh.last_completed_refresh()
             current_app.logger.debug("Starting refresh...")
-            do_update(last_refresh, now)
+            with profile_refresh():
+                do_update(last_refresh, now)
             current_app.logger.debug("Refresh completed")
         else:
             current_app.logger.debug(
@@ -2,23 +2,36 @@ import re
 
 from flask import (
     Blueprint,
+    Response,
     current_app,
     jsonify,
     make_response,
     render_template,
     request,
+    send_from_directory,
 )
 
-import app.updater as updater
-from app.lookup import find_case
+import app.profiling as profiling
+import app.stats as stats
+import app.stream as stream
 from app.models import Refresh, Update
 
 
 views = Blueprint("app", __name__)
 
+# Static bulk export files. Kept off the views blueprint so serving them never runs the
+# updater or touches the database.
+exports = Blueprint("exports", __name__)
+
+# Profiling reports, only visible with the PROFILING_TOKEN
+profiles = Blueprint("profiles", __name__)
+
 
 @views.before_request
 def before():
+    # Imported on first use to keep requests/dateutil out of app startup
+    import app.updater as updater
+
     updater.update()
 
 
@@ -52,18 +65,68 @@ def refreshes_json():
 def updates():
     # Pagination example: https://betterprogramming.pub/simple-flask-pagination-example-4190b12c2e2e
     page = request.args.get("page", 1, type=int)
-    updates = Update.query.order_by(
-        Update.create_date.desc(), Update.event_date.desc()
-    ).paginate(page=page, per_page=current_app.config["ITEMS_PER_PAGE"])
-    return render_template("updates.html", updates=updates)
+    filters = _update_filters()
+    updates = (
+        Update.filtered(**filters)
+        .order_by(Update.create_date.desc(), Update.event_date.desc())
+        .paginate(page=page, per_page=current_app.config["ITEMS_PER_PAGE"])
+    )
+    return render_template("updates.html", updates=updates, filters=filters)
 
 
 @views.route("/updates.json")
 def updates_json():
-    updates = Update.query.all()  # TODO: trim to last 30 days?
+    updates = Update.filtered(**_update_filters()).all()  # TODO: trim to last 30 days?
     return jsonify([update.to_dict() for update in updates])
 
 
+def _update_filters():
+    return {
+        "allegation": request.args.get("allegation", type=str),
+        "officer": request.args.get("officer", type=str),
+    }
+
+
+@views.route("/updates/stream")
+def updates_stream():
+    config = current_app.config
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None:
+        last_id = request.args.get("last_id", type=int)
+
+    # The slot is taken last so a failing start or replay can't leak it, and released
+    # when the response closes, whether or not the stream was ever iterated
+    stream.broadcaster.start(current_app._get_current_object())
+    replay = []
+    if last_id is not None:
+        replay = stream.fetch_events(last_id, config["STREAM_REPLAY_LIMIT"])
+
+    subscription = stream.broadcaster.subscribe(
+        config["STREAM_BUFFER"],
+        config["STREAM_MAX_CLIENTS"],
+        replay[-1][0] if replay else last_id,
+    )
+    if not subscription:
+        resp = make_response("Too many stream clients, try again later", 503)
+        resp.headers["Retry-After"] = "60"
+        return resp
+
+    resp = Response(
+        stream.stream(
+            subscription,
+            replay,
+            config["STREAM_KEEPALIVE"],
+            last_id,
+            replay_complete=len(replay) < config["STREAM_REPLAY_LIMIT"],
+        ),
+        mimetype="text/event-stream",
+    )
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.call_on_close(lambda: stream.broadcaster.unsubscribe(subscription))
+    return resp
+
+
 @views.route("/updates/<id>")
 def update(id):
     update = Update.query.filter_by(id=id).one_or_none()
@@ -74,6 +137,8 @@ def update(id):
 
 @views.route("/case")
 def case():
+    from app.lookup import find_case
+
     case_num = request.args.get("id", type=str)
     if not case_num or not re.match("^\\d{4}OPA-\\d{4}$", case_num):
         return "Invalid case number", 400
@@ -103,6 +168,43 @@ def updates_atom():
     return resp
 
 
+@views.route("/stats")
+def stats_page():
+    return render_template("stats.html", stats=stats.summary())
+
+
+@views.route("/stats.json")
+def stats_json():
+    return jsonify(stats.summary())
+
+
 @views.route("/robots.txt")
 def robots():
     return render_template("robots.txt")
+
+
+@exports.route("/export/")
+@exports.route("/export/<path:filename>")
+def export_file(filename="manifest.json"):
+    if filename.startswith("."):
+        return "Not found", 404
+    return send_from_directory(current_app.config["EXPORT_DIR"], filename, max_age=300)
+
+
+@profiles.route("/profiles")
+def profile_index():
+    if not profiling.is_admin():
+        return "Not found", 404
+    return render_template(
+        "profiles.html",
+        profiles=profiling.list_profiles(profiling.profile_dir(current_app)),
+    )
+
+
+@profiles.route("/profiles/<name>")
+def profile_report(name):
+    if not profiling.is_admin() or name.startswith("."):
+        return "Not found", 404
+    return send_from_directory(
+        profiling.profile_dir(current_app), name, mimetype="text/plain"
+    )
@@ -0,0 +1,67 @@
+"""Measure worker startup cost: importing the app module and running create_app.
+
+Each sample runs in a fresh interpreter so module caching doesn't hide import cost.
+
+    python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+
+ROOT = Path(__file__).parent.parent.absolute()
+
+SAMPLE = """
+import json, sys, time
+start = time.perf_counter()
+from app.app import create_app
+imported = time.perf_counter()
+create_app("testing")
+created = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "modules": len(sys.modules),
+    "eager": [m for m in ("requests", "dateutil") if m in sys.modules],
+}))
+"""
+
+
+def sample(env):
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument("--runs", type=int, default=10)
+    args = argparser.parse_args()
+
+    with tempfile.TemporaryDirectory() as logging_dir:
+        env = {**os.environ, "LOGGING_DIR": logging_dir}
+        samples = [sample(env) for _ in range(args.runs)]
+
+    for key in ["import", "create_app"]:
+        times = [s[key] * 1000 for s in samples]
+        print(
+            f"{key:>10}: median {statistics.median(times):7.2f} ms, "
+            f"min {min(times):7.2f} ms, max {max(times):7.2f} ms"
+        )
+    print(f"   modules: {samples[-1]['modules']}")
+    print(f"     eager: {', '.join(samples[-1]['eager']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
+from datetime import datetime
+
 import pytest
 
 from app.app import create_app
+from app.models import Update, UpdateType
 from app.models import db as _db
 
 
@@ -26,3 +29,26 @@ def db(flask):
     _db.app = flask
     _db.create_all()
     return _db
+
+
+@pytest.fixture
+def create_update():
+    def create_update(
+        case_num="2022OPA-0001",
+        type=UpdateType.COMPLAINT_FILED,
+        create_date=datetime(1970, 1, 1),
+        event_date=None,
+        allegations=None,
+        disposition=None,
+    ):
+        update = Update()
+        update.case_num = case_num
+        update.type = type
+        update.create_date = create_date
+        update.event_date = event_date or create_date
+        update.officers = []
+        update.allegations = allegations or []
+        update.disposition = disposition
+        return update
+
+    return create_update
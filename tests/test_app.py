@@ -0,0 +1,21 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_create_app_defers_heavy_imports(tmp_path):
+    script = (
+        "import sys\n"
+        "from app.app import create_app\n"
+        "create_app('testing')\n"
+        "print(','.join(m for m in ('requests', 'dateutil') if m in sys.modules))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).parent.parent,
+        env={"LOGGING_DIR": str(tmp_path), "PATH": ""},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert output.strip() == ""
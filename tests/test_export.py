@@ -0,0 +1,110 @@
+import csv
+import hashlib
+import json
+from datetime import datetime
+
+from app.export import export_updates
+
+
+def test_export_updates(flask, db, create_update, tmp_path):
+    flask.config["EXPORT_DIR"] = tmp_path
+
+    db.session.add(
+        create_update(
+            "2022OPA-0001",
+            create_date=datetime(2022, 4, 30),
+            allegations=["Professionalism"],
+        )
+    )
+    db.session.add(
+        create_update(
+            "2022OPA-0002",
+            create_date=datetime(2022, 5, 1),
+            allegations=["Professionalism"],
+        )
+    )
+    db.session.commit()
+    assert export_updates() == 2
+    assert export_updates() == 0
+
+    db.session.add(
+        create_update(
+            "2022OPA-0003",
+            create_date=datetime(2022, 5, 2),
+            allegations=["Professionalism"],
+        )
+    )
+    db.session.commit()
+    assert export_updates() == 1
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert manifest["last_id"] == 3
+    assert manifest["files"]["updates-2022-04.ndjson"]["rows"] == 1
+    assert manifest["files"]["updates-2022-05.csv"]["rows"] == 2
+
+    for name, entry in manifest["files"].items():
+        content = (tmp_path / name).read_bytes()
+        assert entry["bytes"] == len(content)
+        assert entry["sha256"] == hashlib.sha256(content).hexdigest()
+
+    rows = [
+        json.loads(line)
+        for line in (tmp_path / "updates-2022-05.ndjson").read_text().splitlines()
+    ]
+    assert [row["case_num"] for row in rows] == ["2022OPA-0002", "2022OPA-0003"]
+
+    with open(tmp_path / "updates-2022-05.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["case_num"] for row in rows] == ["2022OPA-0002", "2022OPA-0003"]
+    assert json.loads(rows[0]["allegations"]) == ["Professionalism"]
+
+
+def test_export_file_range(flask, db, create_update, tmp_path):
+    flask.config["EXPORT_DIR"] = tmp_path
+    db.session.add(
+        create_update(
+            "2022OPA-0001",
+            create_date=datetime(2022, 5, 1),
+            allegations=["Professionalism"],
+        )
+    )
+    db.session.commit()
+    export_updates()
+
+    client = flask.test_client()
+    assert client.get("/export/").get_json()["last_id"] == 1
+
+    resp = client.get("/export/updates-2022-05.ndjson", headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 206
+    assert resp.data == (tmp_path / "updates-2022-05.ndjson").read_bytes()[:10]
+
+    assert client.get("/export/.lock").status_code == 404
+
+
+def test_export_rebuilds_missing_file(flask, db, create_update, tmp_path):
+    flask.config["EXPORT_DIR"] = tmp_path
+    db.session.add(create_update("2022OPA-0001", create_date=datetime(2022, 4, 1)))
+    db.session.add(create_update("2022OPA-0002", create_date=datetime(2022, 5, 1)))
+    db.session.commit()
+    export_updates()
+
+    expected = (tmp_path / "updates-2022-05.ndjson").read_bytes()
+    (tmp_path / "updates-2022-05.ndjson").unlink()
+    (tmp_path / "updates-2022-04.csv").write_bytes(b"")
+
+    db.session.add(create_update("2022OPA-0003", create_date=datetime(2022, 5, 2)))
+    db.session.commit()
+    assert export_updates() == 1
+
+    content = (tmp_path / "updates-2022-05.ndjson").read_bytes()
+    assert content.startswith(expected)
+    assert b"\0" not in content
+    assert len(content.splitlines()) == 2
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    for name, entry in manifest["files"].items():
+        content = (tmp_path / name).read_bytes()
+        assert entry["bytes"] == len(content)
+        assert entry["sha256"] == hashlib.sha256(content).hexdigest()
+    assert manifest["files"]["updates-2022-04.csv"]["rows"] == 1
+    assert b"2022OPA-0001" in (tmp_path / "updates-2022-04.csv").read_bytes()
@@ -0,0 +1,40 @@
+from app.app import create_app
+from app.config import TestConfig
+from app.models import db
+
+
+def test_profile_request_with_token(monkeypatch, tmp_path):
+    monkeypatch.setattr(TestConfig, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(TestConfig, "LOGGING_DIR", tmp_path)
+    flask = create_app("testing")
+
+    with flask.app_context():
+        db.create_all()
+        client = flask.test_client()
+
+        client.get("/updates")
+        assert not (tmp_path / "profiles").exists()
+
+        client.get("/updates", headers={"X-Profile": "wrong"})
+        assert not (tmp_path / "profiles").exists()
+
+        client.get("/updates", headers={"X-Profile": "secret"})
+        reports = list((tmp_path / "profiles").glob("*.txt"))
+        assert len(reports) == 1
+        report = reports[0].read_text()
+        assert report.startswith("GET /updates?")
+        assert "SELECT" in report
+        assert "render_template" in report
+
+        assert client.get("/profiles").status_code == 404
+        assert client.get("/profiles?token=secret").status_code == 404
+        assert (
+            client.get(f"/profiles/{reports[0].name}?token=secret").status_code == 404
+        )
+        resp = client.get("/profiles", headers={"X-Profile": "secret"})
+        assert reports[0].name.encode() in resp.data
+        assert b"token" not in resp.data
+        resp = client.get(
+            f"/profiles/{reports[0].name}", headers={"X-Profile": "secret"}
+        )
+        assert resp.data.decode() == report
@@ -0,0 +1,156 @@
+import json
+import time
+from unittest.mock import patch
+
+from app.app import create_app
+from app.config import TestConfig
+from app.models import db
+from app.stream import Broadcaster, Subscription, broadcaster, stream
+
+
+def test_stream_resumes_from_last_event_id(flask, db, create_update):
+    for case_num in ["2022OPA-0001", "2022OPA-0002", "2022OPA-0003"]:
+        db.session.add(create_update(case_num))
+    db.session.commit()
+
+    resp = flask.test_client().get(
+        "/updates/stream", headers={"Last-Event-ID": "1"}, buffered=False
+    )
+    assert resp.mimetype == "text/event-stream"
+
+    chunks = iter(resp.response)
+    assert next(chunks).startswith(b"retry:")
+    first, second = next(chunks).decode(), next(chunks).decode()
+    assert first.startswith("id: 2\nevent: update\n")
+    assert json.loads(first.split("data: ")[1])["case_num"] == "2022OPA-0002"
+    assert second.startswith("id: 3\n")
+    resp.close()
+
+
+def test_stream_skips_replayed_and_ends_on_overflow():
+    broadcaster = Broadcaster()
+    subscription = broadcaster.subscribe(maxlen=2, max_clients=10)
+    messages = stream(subscription, [(2, "{}")], keepalive=0.01, last_id=1)
+    assert next(messages).startswith("retry:")
+    assert next(messages).startswith("id: 2\n")
+
+    broadcaster.publish([(2, "{}"), (3, "{}")])
+    assert next(messages).startswith("id: 3\n")
+    assert next(messages) == ": keepalive\n\n"
+
+    broadcaster.publish([(4, "{}"), (5, "{}"), (6, "{}")])
+    assert subscription.overflowed
+    assert [m[:5] for m in messages] == ["id: 4", "id: 5"]
+
+
+def test_subscription_buffer_is_bounded():
+    subscription = Subscription(maxlen=1)
+    subscription.push((1, "{}"))
+    subscription.push((2, "{}"))
+    assert list(subscription.events) == [(1, "{}")]
+    assert subscription.overflowed
+
+
+def test_subscribe_catches_up_from_recent_events():
+    broadcaster = Broadcaster(recent=2)
+    broadcaster.publish([(1, "{}"), (2, "{}")])
+
+    subscription = broadcaster.subscribe(maxlen=10, max_clients=10, after_id=1)
+    assert list(subscription.events) == [(2, "{}")]
+    assert not subscription.overflowed
+
+    broadcaster.publish([(3, "{}")])
+    subscription = broadcaster.subscribe(maxlen=10, max_clients=10, after_id=0)
+    assert list(subscription.events) == [(2, "{}"), (3, "{}")]
+    # Event 1 was forgotten, so the client has to reconnect and replay it
+    assert subscription.overflowed
+
+
+def test_head_request_releases_stream_slot(flask, db):
+    flask.config["STREAM_MAX_CLIENTS"] = 2
+    client = flask.test_client()
+
+    for _ in range(3):
+        # The server closes the response without iterating the body
+        resp = client.head("/updates/stream")
+        assert resp.status_code == 200
+        resp.close()
+    assert not broadcaster.subscriptions
+
+    resp = client.get("/updates/stream", buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+
+
+def test_failed_replay_releases_stream_slot(flask, db):
+    flask.config["STREAM_MAX_CLIENTS"] = 1
+    client = flask.test_client()
+
+    with patch("app.stream.fetch_events", side_effect=Exception(":(")):
+        resp = client.get("/updates/stream", headers={"Last-Event-ID": "1"})
+        assert resp.status_code == 500
+    assert not broadcaster.subscriptions
+
+    resp = client.get("/updates/stream", buffered=False)
+    assert resp.status_code == 200
+    resp.close()
+
+
+def test_stream_rejects_clients_over_limit(flask, db):
+    flask.config["STREAM_MAX_CLIENTS"] = 1
+    client = flask.test_client()
+
+    first = client.get("/updates/stream", buffered=False)
+    assert first.status_code == 200
+
+    second = client.get("/updates/stream", buffered=False)
+    assert second.status_code == 503
+    assert second.headers["Retry-After"]
+
+    first.close()
+    third = client.get("/updates/stream", buffered=False)
+    assert third.status_code == 200
+    third.close()
+
+
+def test_stream_pushes_updates_from_poller(monkeypatch, tmp_path, create_update):
+    # A file database, so the poller thread sees what this thread commits, like
+    # updates committed by another worker
+    monkeypatch.setattr(
+        TestConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path}/db.sqlite3"
+    )
+    monkeypatch.setattr(TestConfig, "STREAM_POLL_INTERVAL", 0.05)
+    flask = create_app("testing")
+
+    with flask.app_context():
+        db.create_all()
+        db.session.add(create_update("2022OPA-0001"))
+        db.session.commit()
+
+        try:
+            resp = flask.test_client().get("/updates/stream", buffered=False)
+            chunks = iter(resp.response)
+            assert next(chunks).startswith(b"retry:")
+
+            db.session.add(create_update("2022OPA-0002"))
+            db.session.commit()
+            event = next(chunks).decode()
+            assert event.startswith("id: 2\nevent: update\n")
+            assert json.loads(event.split("data: ")[1])["case_num"] == "2022OPA-0002"
+            resp.close()
+            assert not broadcaster.subscriptions
+
+            # Committed while nobody is connected and not sent to the next client
+            db.session.add(create_update("2022OPA-0003"))
+            db.session.commit()
+            time.sleep(0.3)
+
+            resp = flask.test_client().get("/updates/stream", buffered=False)
+            chunks = iter(resp.response)
+            next(chunks)
+            db.session.add(create_update("2022OPA-0004"))
+            db.session.commit()
+            assert next(chunks).decode().startswith("id: 4\n")
+            resp.close()
+        finally:
+            broadcaster.stop()
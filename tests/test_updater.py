@@ -1,10 +1,12 @@
+import re
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 import app.updater
-from app.models import Refresh, RefreshStatus, Update, UpdateType
+from app import stats
+from app.models import Allegation, CaseState, Refresh, RefreshStatus, Update, UpdateType
 from app.updater import do_update, update
 
 
@@ -115,3 +117,238 @@ def test_updater(flask, db, updater):
     refresh_date = datetime.now()
     updates = updater.update(refresh_date - timedelta(weeks=10), refresh_date)
     assert len(updates) > 0
+
+
+def test_do_update_indexes_allegations(flask, db, create_update):
+    last_refresh = Refresh()
+    last_refresh.refresh_date = NOW - timedelta(weeks=1)
+    last_refresh.closed_case_summary_last_updated = NOW - timedelta(weeks=1)
+
+    updater = MagicMock()
+    updater.update.return_value = [
+        create_update(
+            "2022OPA-0001",
+            UpdateType.CCS_PUBLISHED,
+            event_date=NOW,
+            allegations=["Use of Force", "Professionalism"],
+        ),
+        create_update(
+            "2022OPA-0002",
+            UpdateType.CCS_PUBLISHED,
+            event_date=NOW,
+            allegations=["Professionalism"],
+        ),
+    ]
+    app.updater.updaters = [(updater, "closed_case_summary_last_updated")]
+
+    do_update(last_refresh, datetime.now())
+
+    assert Allegation.query.count() == 2
+    assert [u.case_num for u in Update.filtered(allegation="Use of Force")] == [
+        "2022OPA-0001"
+    ]
+    assert Update.filtered(allegation="Professionalism").count() == 2
+
+
+def test_do_update_records_stats(flask, db, create_update):
+    last_refresh = Refresh()
+    last_refresh.refresh_date = NOW - timedelta(weeks=1)
+    last_refresh.closed_case_summary_last_updated = NOW - timedelta(weeks=1)
+
+    def create_stats_update(allegations):
+        return create_update(
+            ":)",
+            UpdateType.CCS_PUBLISHED,
+            event_date=datetime(2022, 5, 3),
+            allegations=allegations,
+            disposition="Partially Sustained",
+        )
+
+    updater = MagicMock()
+    updater.update.return_value = [
+        create_stats_update(["Use of Force", "Professionalism"]),
+        create_stats_update(["Professionalism"]),
+    ]
+    app.updater.updaters = [(updater, "closed_case_summary_last_updated")]
+
+    do_update(last_refresh, datetime.now())
+    incremental = stats.summary()
+
+    assert incremental == {
+        "type": {"CCS_PUBLISHED": 2},
+        "disposition": {"Partially Sustained": 2},
+        "allegation": {"Professionalism": 2, "Use of Force": 1},
+        "month": {"2022-05": 2},
+    }
+
+    stats.rebuild()
+    assert stats.summary() == incremental
+
+
+def complaint_row(file_number, allegation, received_date="2022-05-02T00:00:00.000"):
+    return {
+        "file_number": file_number,
+        "allegation": allegation,
+        "disposition": "-",
+        "received_date": received_date,
+    }
+
+
+def refresh_with(updater, rows, get=None):
+    """Run do_update with a single real updater over the given API rows (or get)."""
+    last_refresh = Refresh()
+    last_refresh.refresh_date = NOW - timedelta(days=1)
+    last_refresh.complaint_filed_last_updated = datetime(2022, 5, 1)
+    app.updater.updaters = [(updater, "complaint_filed_last_updated")]
+
+    before = {u.id for u in Update.query}
+    refresh_date = datetime.now()
+    with patch("app.updater.requests.get", side_effect=get) as mock_get:
+        mock_get.return_value.json.return_value = rows
+        do_update(last_refresh, refresh_date)
+
+    refresh = Refresh.query.filter_by(refresh_date=refresh_date).one()
+    new = [u.case_num for u in Update.query if u.id not in before]
+    return refresh.status, new
+
+
+def test_updater_emits_only_changed_cases(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+
+    def fetch(rows):
+        status, new = refresh_with(updater, rows)
+        assert status == RefreshStatus.COMPLETED
+        return new
+
+    assert fetch([complaint_row("2022OPA-0001", "Professionalism")]) == ["2022OPA-0001"]
+    # Unchanged on the next (sweep) fetch
+    assert fetch([complaint_row("2022OPA-0001", "Professionalism")]) == []
+    # Allegation added later
+    assert fetch(
+        [
+            complaint_row("2022OPA-0001", "Professionalism"),
+            complaint_row("2022OPA-0001", "Use of Force"),
+        ]
+    ) == ["2022OPA-0001"]
+    # Older case seen for the first time in a sweep is recorded but not reported
+    old_row = complaint_row("2022OPA-0002", "Professionalism", "2022-02-01T00:00:00")
+    assert fetch([old_row]) == []
+    assert CaseState.query.filter_by(case_num="2022OPA-0002").one()
+
+
+def test_failed_enrich_does_not_record_state(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+    rows = [complaint_row("2022OPA-0001", "Professionalism")]
+
+    with patch.object(updater, "enrich", side_effect=Exception(":(")):
+        assert refresh_with(updater, rows) == (RefreshStatus.FAILED, [])
+    assert CaseState.query.count() == 0
+
+    # The retry still reports the case
+    assert refresh_with(updater, rows) == (RefreshStatus.COMPLETED, ["2022OPA-0001"])
+    assert CaseState.query.count() == 1
+
+
+def test_closed_case_summary_hash_ignores_allegations(create_update):
+    updater = app.updater.ClosedCaseSummaryUpdater()
+    update = create_update(type=UpdateType.CCS_PUBLISHED, disposition="-")
+    before = updater.state_hash(update)
+
+    update.allegations = ["Professionalism"]
+    assert updater.state_hash(update) == before
+
+    update.disposition = "Partially Sustained"
+    assert updater.state_hash(update) != before
+
+
+def paged_get(rows):
+    """Fake requests.get serving rows according to the query's limit and offset."""
+
+    def get(url):
+        limit, offset = re.search(r"limit (\d+) offset (\d+)$", url).groups()
+        response = MagicMock()
+        response.json.return_value = rows[int(offset) : int(offset) + int(limit)]
+        return response
+
+    return get
+
+
+def test_updater_fetches_all_pages(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+    rows = [complaint_row("2022OPA-0001", f"Allegation {i}") for i in range(5)]
+
+    with patch("app.updater.PAGE_SIZE", 2), patch(
+        "app.updater.requests.get", side_effect=paged_get(rows)
+    ) as get:
+        updates = updater.update(datetime(2022, 5, 1), NOW)
+
+    assert get.call_count == 3
+    assert len(updates) == 1
+    assert len(updates[0].allegations) == 5
+
+
+def test_updater_fails_past_fetch_limit(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+    flask.config["FETCH_MAX_ROWS"] = 4
+    rows = [complaint_row("2022OPA-0001", f"Allegation {i}") for i in range(5)]
+
+    with patch("app.updater.PAGE_SIZE", 2), patch(
+        "app.updater.requests.get", side_effect=paged_get(rows)
+    ):
+        with pytest.raises(RuntimeError):
+            updater.update(datetime(2022, 5, 1), NOW)
+
+
+def test_sweep_over_fetch_limit_falls_back_to_new_entries(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+    flask.config["FETCH_MAX_ROWS"] = 4
+    flask.config["SWEEP_WINDOW"] = datetime.now() - datetime(2022, 1, 1)
+    new_rows = [complaint_row("2022OPA-0001", "Professionalism")]
+    sweep_rows = new_rows + [
+        complaint_row("2021OPA-0001", f"Allegation {i}", "2022-02-01T00:00:00")
+        for i in range(5)
+    ]
+
+    def get(url):
+        assert "'2022-01-01'" in url or "'2022-05-01'" in url
+        if "'2022-05-01'" in url:
+            return paged_get(new_rows)(url)
+        return paged_get(sweep_rows)(url)
+
+    with patch("app.updater.PAGE_SIZE", 2):
+        # refresh_with sweeps: its last refresh was the day before
+        status, new = refresh_with(updater, None, get)
+
+    assert status == RefreshStatus.COMPLETED
+    assert new == ["2022OPA-0001"]
+
+
+def test_changed_case_is_reported_as_case_update(flask, db):
+    updater = app.updater.NewComplaintUpdater()
+    refresh_with(updater, [complaint_row("2022OPA-0001", "Professionalism")])
+    refresh_with(
+        updater,
+        [
+            complaint_row("2022OPA-0001", "Professionalism"),
+            complaint_row("2022OPA-0001", "Use of Force"),
+        ],
+    )
+
+    assert [u.type for u in Update.query.order_by(Update.id)] == [
+        UpdateType.COMPLAINT_FILED,
+        UpdateType.CASE_UPDATED,
+    ]
+    assert stats.summary()["type"] == {"COMPLAINT_FILED": 1, "CASE_UPDATED": 1}
+
+
+def test_investigation_closed_does_not_report_changes(flask, db):
+    updater = app.updater.ClosedInvestigationUpdater()
+
+    def row(allegation):
+        return {
+            **complaint_row("2022OPA-0001", allegation),
+            "investigation_end_date": "2022-05-02T00:00:00.000",
+        }
+
+    assert refresh_with(updater, [row("Professionalism")])[1] == ["2022OPA-0001"]
+    assert refresh_with(updater, [row("Professionalism"), row("Use of Force")])[1] == []
@@ -0,0 +1,34 @@
+from app import stats
+
+
+def test_updates_json_filter(flask, db, create_update):
+    for update in [
+        create_update("2022OPA-0001", allegations=["Use of Force"]),
+        create_update("2022OPA-0002", allegations=["Professionalism"]),
+    ]:
+        db.session.add(update)
+        update.index()
+    db.session.commit()
+
+    client = flask.test_client()
+
+    resp = client.get("/updates.json", query_string={"allegation": "Use of Force"})
+    assert [u["case_num"] for u in resp.get_json()] == ["2022OPA-0001"]
+
+    resp = client.get("/updates.json")
+    assert len(resp.get_json()) == 2
+
+    resp = client.get("/updates", query_string={"allegation": "Professionalism"})
+    assert resp.status_code == 200
+    assert b"2022OPA-0002" in resp.data
+    assert b"2022OPA-0001" not in resp.data
+
+
+def test_stats_json(flask, db, create_update):
+    db.session.add(create_update("2022OPA-0001", allegations=["Use of Force"]))
+    db.session.commit()
+    stats.rebuild()
+
+    resp = flask.test_client().get("/stats.json")
+    assert resp.get_json()["type"] == {"COMPLAINT_FILED": 1}
+    assert flask.test_client().get("/stats").status_code == 200
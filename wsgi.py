@@ -2,3 +2,8 @@ from app.app import create_app
 
 
 app = create_app()
+
+# The updater and lookup modules (and requests/dateutil with them) are otherwise
+# imported on the first request. Under gunicorn --preload this runs once in the master
+# process and the loaded modules are shared copy-on-write with every forked worker.
+from app import lookup, updater  # noqa: F401